@@ -115,9 +115,13 @@ namespace uhal
         std::string m_baseAddrStr;  ///< Base addr of reg/ram the test will use. Use a string as workaround for hex input via boost::program_options
         boost::uint32_t m_baseAddr;  ///< The m_baseAddrStr as converted into an actual unsigned value.
         boost::uint32_t m_bandwidthTestDepth;  ///< The depth of read/write used in bandwidth tests
+        std::vector<boost::uint32_t> m_sweepDepths;  ///< Depths to sweep through in bandwidth tests (if non-empty, used instead of m_bandwidthTestDepth)
         bool m_verbose;  ///< Verbosity true/false flag.
         bool m_perIterationDispatch; ///< Perform a network dispatch every iteration flag.
         bool m_includeConnect; ///< Include (e.g. TCP) connect time in reported bandwidth/latency
+        bool m_machineOutput; ///< Output the results of each test as a single line of space-separated numbers
+        bool m_readingStdin; ///< True whilst running command lines read from stdin
+        std::map<std::string, ClientVec> m_clientCache;  ///< Clients built by previous tests, re-used when reading command lines from stdin
 
 
         // PRIVATE MEMBER FUNCTIONS - Test infrastructure
@@ -137,9 +141,15 @@ namespace uhal
         /// Constructs and sets up the appropriate IPbusClient for use in the test
         void buildClients();
 
+        /// Runs each line read from stdin as a separate command line (reusing clients), printing "__DONE__<exit code>" after each.
+        int runFromStdin ( const std::string& aExecutable );
+
         /// Outputs a standard result set to screen - provide it with the number of seconds the test took.
         void outputStandardResults ( double totalSeconds ) const;
 
+        /// Outputs bandwidth test results as a single line of space-separated numbers: depth, iteration frequency (Hz) and bandwidth (KB/s).
+        void outputMachineResults ( double totalSeconds, double dataRateKB_s ) const;
+
         /// Returns a random uint32_t in the range [0,maxSize], with 1/x probability distribution -- so that p(x=0) = p(2<=x<4) = p(2^n <= x < 2^n+1)
         static uint32_t getRandomBlockSize ( const uint32_t maxSize );
 
@@ -165,6 +175,7 @@ namespace uhal
 
         void bandwidthRxTest();  ///< Read bandwidth test
         void bandwidthTxTest();  ///< Write bandwidth test
+        void bandwidthTxRxTest();  ///< Write bandwidth test followed by read bandwidth test
         void validationTest();   ///< Historic basic firmware/software validation test
 
     public:
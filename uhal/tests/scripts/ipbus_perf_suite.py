@@ -8,24 +8,24 @@ N.B: You must set LD_LIBRARY_PATH and PATH appropriately before this
      [So that this script can be run for checked-out sources (during dev) or installed RPMs.]
 """
 
+from collections import defaultdict
 from datetime import datetime
-import fcntl
 import getopt
 import getpass
 from itertools import izip
-from math import sqrt
 from math import ceil
+from multiprocessing.pool import ThreadPool
 import numpy
 import os
 import paramiko
 import pickle
-from random import randint
 import re
+import select
 import signal
+import socket
 from socket import gethostname
 import subprocess
 import sys
-import tempfile
 import threading
 import time
 
@@ -72,6 +72,8 @@ CHANGES_TAG = "No changes"
 #####################################################################################################
 # CONSTANTS derived from global options
 
+# Prepended to every command run via SSH, so that the remote commands see the same environment
+_ENV_PREFIX = "".join("export " + env_var + "=" + value + " ; " for env_var, value in CH_PC_ENV.iteritems())
 
 
 ###################################################################################################
@@ -91,6 +93,12 @@ SCRIPT_LOGGER.setLevel(logging.WARNING)
 ####################################################################################################
 #  SETUP MATPLOTLIB
 
+import matplotlib
+
+# Without a display (e.g. running over SSH), plots can only be saved to file, so use non-interactive backend
+if not os.environ.get('DISPLAY'):
+    matplotlib.use('Agg')
+
 import matplotlib.pyplot as plt
 
 
@@ -119,15 +127,33 @@ class CommandBadExitCode(Exception):
 ####################################################################################################
 #  COMMAND-RUNNING/PARSING FUNCTIONS
 
-def run_command(cmd, ssh_client=None, parser=None, throw_on_bad_exit_code=True):
+_PERF_FREQ_RE = re.compile(r"^Test iteration frequency\s+=\s*([\d\.]+)\s*Hz", flags=re.MULTILINE)
+_PERF_BW_RE = re.compile(r"^Average \S+ bandwidth\s+=\s*([\d\.]+)\s*KB/s", flags=re.MULTILINE)
+_PERF_DEPTH_RE = re.compile(r"^\S+ depth used each iteration\s*=\s*(\d+)", flags=re.MULTILINE)
+_PERF_MACHINE_RE = re.compile(r"^(\d+) ([\d\.]+) ([\d\.]+)$", flags=re.MULTILINE)
+_PING_TIME_RE = re.compile(r"\stime=([\d\.]+) ms")
+
+# Commands whose output is parsed with parse_perftester by default
+_PERF_PREFIXES = ("PerfTester.exe", "perf_tester.escript")
+# Replacement for leading "sudo" in commands, so that PATH is preserved
+_SUDO_PREFIX = "sudo PATH=$PATH "
+
+# Outputs /proc/stat, /proc/meminfo, page size, and then one line per PID: /proc/<pid>/stat and /proc/<pid>/statm
+_PROC_SAMPLE_CMD = ("cat /proc/stat /proc/meminfo ; echo PAGESIZE $(getconf PAGESIZE) ; "
+                    "for pid in %s ; do echo PID $(cat /proc/$pid/stat /proc/$pid/statm 2>/dev/null) ; done")
+
+def run_command(cmd, ssh_client=None, parser=None, throw_on_bad_exit_code=True, timeout=None):
   """
   Run command, returning tuple of exit code and stdout/err.
-  The command will be killed if it takes longer than TEST_CMD_TIMEOUT_S
+  The command will be killed if it takes longer than timeout. By default, the timeout is TEST_CMD_TIMEOUT_S,
+  except for commands run via a plain SSH client, which have no timeout (e.g. servers that run until killed)
   """
-  if (parser is None) and (cmd.startswith("PerfTester.exe") or cmd.startswith("perf_tester.escript")):
+  if (timeout is None) and ((ssh_client is None) or isinstance(ssh_client, (PersistentPerfTester, RemoteShell))):
+      timeout = TEST_CMD_TIMEOUT_S
+  if (parser is None) and cmd.startswith(_PERF_PREFIXES):
       parser = parse_perftester
   if cmd.startswith("sudo"):
-      cmd = "sudo PATH=$PATH " + cmd[4:]
+      cmd = _SUDO_PREFIX + cmd[4:]
 
   if ssh_client is None:
     SCRIPT_LOGGER.debug("Running (locally): "+cmd)
@@ -139,36 +165,32 @@ def run_command(cmd, ssh_client=None, parser=None, throw_on_bad_exit_code=True):
         p  = subprocess.Popen(cmd,stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=None, shell=True, preexec_fn=os.setsid)
 
     try:
-      f1 = fcntl.fcntl(p.stdout, fcntl.F_GETFL)
-      fcntl.fcntl(p.stdout, fcntl.F_SETFL, f1 | os.O_NONBLOCK)
+      # Block until output is available (or the timeout is reached), rather than polling at fixed intervals
+      poller = select.poll()
+      poller.register(p.stdout, select.POLLIN)
 
-      stdout = ""
-      last = time.time()
+      # Output chunks are joined once at the end, rather than repeatedly concatenating strings
+      chunks = []
 
       while True:
-          current = time.time()
-
-          try:
-              nextline = p.stdout.readline()
-              if not nextline:
+          remaining = timeout - (time.time() - t0)
+          if remaining <= 0:
+              os.killpg(p.pid, signal.SIGTERM)
+              raise CommandHardTimeout(cmd, timeout, "".join(chunks))
+
+          if poller.poll(1000 * remaining):
+              data = os.read(p.stdout.fileno(), 65536)
+              if not data:
                   break
-
-              last = time.time()
-              stdout += nextline
-
-          except IOError:
-              time.sleep(0.1)
-             
-              if (current-t0) > TEST_CMD_TIMEOUT_S:
-                  os.killpg(p.pid, signal.SIGTERM)
-                  raise CommandHardTimeout(cmd, TEST_CMD_TIMEOUT_S, stdout)
+              chunks.append(data)
 
     except KeyboardInterrupt:
         print "+ Ctrl-C detected."
         os.killpg(p.pid, signal.SIGTERM)
         raise KeyboardInterrupt
 
-    exit_code = p.poll()
+    stdout = "".join(chunks)
+    exit_code = p.wait()
     if exit_code and throw_on_bad_exit_code:
         raise CommandBadExitCode(cmd, exit_code, stdout)
 
@@ -178,12 +200,37 @@ def run_command(cmd, ssh_client=None, parser=None, throw_on_bad_exit_code=True):
         return parser(stdout)
 
   else:
-    for env_var, value in CH_PC_ENV.iteritems():
-        cmd = "export " + env_var + "=" + value + " ; " + cmd
-    SCRIPT_LOGGER.debug("Running (remotely): "+cmd)
-    stdin, stdout, stderr = ssh_client.exec_command(cmd)
-    exit_code = stdout.channel.recv_exit_status()
-    output = "".join( stdout.readlines() ) + "".join( stderr.readlines() )
+    if isinstance(ssh_client, PersistentPerfTester):
+        SCRIPT_LOGGER.debug("Running (locally, persistent PerfTester.exe): "+cmd)
+        exit_code, output = ssh_client.run(cmd, timeout)
+    elif isinstance(ssh_client, RemoteShell):
+        cmd = _ENV_PREFIX + cmd
+        SCRIPT_LOGGER.debug("Running (remotely, persistent shell): "+cmd)
+        exit_code, output = ssh_client.run(cmd, timeout)
+    else:
+        cmd = _ENV_PREFIX + cmd
+        SCRIPT_LOGGER.debug("Running (remotely): "+cmd)
+        # Stderr merged into stdout, so that both are drained in a single pass (and a full stderr buffer can't block the command)
+        channel = ssh_client.get_transport().open_session()
+        channel.set_combine_stderr(True)
+        channel.exec_command(cmd)
+
+        t0 = time.time()
+        chunks = []
+        try:
+            while True:
+                channel.settimeout(None if (timeout is None) else max(timeout - (time.time() - t0), 0.001))
+                data = channel.recv(65536)
+                if not data:
+                    break
+                chunks.append(data)
+        except socket.timeout:
+            channel.close()
+            raise CommandHardTimeout(cmd, timeout, "".join(chunks))
+
+        exit_code = channel.recv_exit_status()
+        channel.close()
+        output = "".join(chunks)
    
     SCRIPT_LOGGER.debug("Output is ...\n"+output)
  
@@ -196,16 +243,61 @@ def run_command(cmd, ssh_client=None, parser=None, throw_on_bad_exit_code=True):
         return parser(output)
 
 
+def _parse_perftester_runs(cmd_output):
+    """
+    Parses output of PerfTester.exe - either machine-readable (-m option) or standard - and returns list
+    of (depth, latency per iteration (us), bandwidth (Gbit/s)) tuples, one for each test that was run
+    """
+    runs = _PERF_MACHINE_RE.findall(cmd_output)
+    if not runs:
+        # N.B. Output of perf_tester.escript doesn't include the depth
+        freqs = _PERF_FREQ_RE.findall(cmd_output)
+        depths = _PERF_DEPTH_RE.findall(cmd_output) or [None] * len(freqs)
+        runs = izip(depths, freqs, _PERF_BW_RE.findall(cmd_output))
+    return [(int(depth) if depth else None, 1000000.0/float(freq), float(bw) / 125e3) for depth, freq, bw in runs]
+
+
 def parse_perftester(cmd_output):
-    """Parses output of PerfTester.exe, and return tuple of latency per iteration (us), and bandwidth (Gbit/s)"""
+    """
+    Parses output of PerfTester.exe, and return tuple of latency per iteration (us), and bandwidth (Gbit/s)
+    For the BandwidthTxRx test, returns 4-tuple: write latency & bandwidth, then read latency & bandwidth.
+    """
     
-    m1 = re.search(r"^Test iteration frequency\s+=\s*([\d\.]+)\s*Hz", cmd_output, flags=re.MULTILINE)
-    freq = float(m1.group(1))
-    m2 = re.search(r"^Average \S+ bandwidth\s+=\s*([\d\.]+)\s*KB/s", cmd_output, flags=re.MULTILINE)
-    bw = float(m2.group(1)) / 125e3
+    results = ()
+    for depth, lat, bw in _parse_perftester_runs(cmd_output):
+        results += (lat, bw)
+    assert len(results) > 0
+
+    SCRIPT_LOGGER.info("Parsed: Latency (us/iteration), bandwidth (Gb/s) = " + str(results))
+    return results
+
+
+def parse_perftester_sweep(cmd_output):
+    """
+    Parses output of PerfTester.exe depth sweep (-s option).
+    Returns dict mapping each depth to tuple of latency per iteration (us), and bandwidth (Gbit/s)
+    (or, for the BandwidthTxRx test, to 4-tuple of write latency & bandwidth, then read latency & bandwidth)
+    """
+
+    results = defaultdict(tuple)
+    for depth, lat, bw in _parse_perftester_runs(cmd_output):
+        results[depth] += (lat, bw)
 
-    SCRIPT_LOGGER.info("Parsed: Latency = " + str(1000000.0/freq) + "us/iteration , bandwidth = " + str(bw) + "Gb/s")
-    return (1000000.0/freq, bw)
+    SCRIPT_LOGGER.info("Parsed: Latency/bandwidth results for " + str(len(results)) + " depths")
+    # Plain dict, so that looking up a depth that wasn't measured raises KeyError rather than returning empty tuple
+    return dict(results)
+
+
+def run_perftester_sweep(test_args, depths, uri, ssh_client=None):
+    """
+    Runs PerfTester.exe once for the whole list of depths, rather than once per depth.
+    Returns dict mapping each depth to tuple of latency per iteration (us), and bandwidth (Gbit/s)
+    """
+    depths = [int(d) for d in depths]
+    assert len(set(depths)) == len(depths), "Duplicate depths in sweep: " + str(depths)
+
+    cmd = "PerfTester.exe -m " + test_args + " -s " + " ".join(str(d) for d in depths) + " -d " + uri
+    return run_command(cmd, ssh_client, parser=parse_perftester_sweep, timeout=TEST_CMD_TIMEOUT_S*len(depths))
 
 
 def parse_fixed_packet_client(cmd_output):
@@ -224,137 +316,358 @@ def parse_fixed_packet_client(cmd_output):
 
 
 def run_ping(target, ssh_client=None):
-    '''Runs unix ping command, parses output and returns average latency'''
+    '''Runs unix ping command, parses output and returns average latency (excluding first 2 warm-up pings)'''
     
     target_dns = target.split(":")[0]
-    run_command("ping -c 2 " + target_dns, ssh_client)
-    exit_code, output = run_command("ping -c 10 " + target_dns, ssh_client)
+    exit_code, output = run_command("ping -c 12 -i 0.2 -W 1 " + target_dns, ssh_client)
 
-    m = re.search(r"^.+\s=\s[\d\.]+/([\d\.]+)/[\d\.]+/[\d\.]+\sms", output, flags=re.MULTILINE)
-    evg_latency_us = 1000 * float(m.group(1))
+    rtts_ms = [float(x) for x in _PING_TIME_RE.findall(output)[2:]]
+    assert len(rtts_ms) > 0
+    avg_latency_us = 1000 * sum(rtts_ms) / len(rtts_ms)
 
     return avg_latency_us
 
 
-def cpu_mem_usage(cmd_to_check, ssh_client=None):
-    assert " " not in cmd_to_check
+def _read_file(path):
+    with open(path) as f:
+        return f.read()
 
-    output = run_command("top -b -n 1 | grep "+cmd_to_check, ssh_client=ssh_client)[1]
-#    SCRIPT_LOGGER.warning("Parsing ...")
-    cpu, mem = 0.0, 0.0    
 
-    regex = re.compile("^\\s*\\d+\\s+\\w+\\s+\\S+\\s+\\S+\\s+"        # PID USER      PR  NI  
-                       "\\w+\\s+\\w+\\s+\\w+\\s+\\S+\\s+"         # VIRT  RES  SHR S
-                       "([\\d+\\.]+)\\s+([\\d+\\.]+)\\s+"         # %CPU %MEM
-                       "[\\d:\\.]+\\s+" + re.escape(cmd_to_check) # TIME+  COMMAND
-                       )
+def _parse_proc_sample(text):
+    """
+    Parses output of _PROC_SAMPLE_CMD, returning tuple of: jiffies elapsed per CPU since boot,
+    dict mapping PID to tuple of (CPU jiffies used, resident memory in bytes), and total memory in bytes
+    """
+    total_jiffies, nr_cpus, mem_total, page_size = 0, 0, 0, 0
+    pid_usage = {}
+    for line in text.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+        elif fields[0] == 'cpu':
+            total_jiffies = sum(int(x) for x in fields[1:])
+        elif fields[0].startswith('cpu'):
+            nr_cpus += 1
+        elif fields[0] == 'MemTotal:':
+            mem_total = 1024 * int(fields[1])
+        elif fields[0] == 'PAGESIZE':
+            page_size = int(fields[1])
+        elif fields[0] == 'PID' and len(fields) > 20:
+            # Fields: 'PID', then /proc/<pid>/stat (utime & stime are fields 14 & 15), then /proc/<pid>/statm (resident is 2nd of 7)
+            pid_usage[fields[1]] = (int(fields[14]) + int(fields[15]), int(fields[-6]))
+
+    return (float(total_jiffies) / nr_cpus,
+            dict((pid, (jiffies, page_size * rss)) for pid, (jiffies, rss) in pid_usage.iteritems()),
+            mem_total)
+
+
+class ProcessUsageSampler(object):
+    """
+    Samples total CPU & memory usage of all processes with a given name, running either locally or remotely
+    (via ssh_client), by reading /proc. Locally this doesn't fork any processes; remotely it runs one command.
+    The PIDs are found when the sampler is created; CPU usage is averaged over the interval since the previous
+    sample, and - like in top - is expressed as a percentage of one CPU core.
+    """
+    def __init__(self, cmd_to_check, ssh_client=None, pids=None):
+        """If pids (list of PIDs, as strings) is specified, then only those processes are sampled."""
+        assert " " not in cmd_to_check
+        self.ssh_client = ssh_client
+
+        if pids is not None:
+            self._pids = pids
+        elif ssh_client is None:
+            comm = cmd_to_check[:15] # Kernel truncates process names to 15 characters
+            self._pids = []
+            for pid in os.listdir('/proc'):
+                try:
+                    if pid.isdigit() and _read_file('/proc/' + pid + '/comm').strip() == comm:
+                        self._pids.append(pid)
+                except IOError:
+                    pass # Process has already exited
+        else:
+            self._pids = run_command("pgrep -x " + cmd_to_check, ssh_client, throw_on_bad_exit_code=False)[1].split()
+
+        self._previous = self._read()
+
+    def _read(self):
+        if self.ssh_client is None:
+            text = _read_file('/proc/stat') + _read_file('/proc/meminfo') + 'PAGESIZE %d\n' % os.sysconf('SC_PAGE_SIZE')
+            for pid in self._pids:
+                try:
+                    text += 'PID ' + _read_file('/proc/' + pid + '/stat').strip() + ' ' + _read_file('/proc/' + pid + '/statm')
+                except IOError:
+                    pass # Process has exited
+        else:
+            text = run_command(_PROC_SAMPLE_CMD % " ".join(self._pids), self.ssh_client)[1]
+        return _parse_proc_sample(text)
 
-    for line in output.splitlines():
-        m = regex.search(line)
-        if m:
-            cpu += float(m.group(1))
-            mem += float(m.group(2))
+    def sample(self):
+        """Returns tuple of CPU usage (%) since the previous sample, and current memory usage (%)"""
+        current = self._read()
+        prev_jiffies, prev_pid_usage, _ = self._previous
+        jiffies, pid_usage, mem_total = current
+        self._previous = current
 
-    return cpu, mem
+        # Only count CPU time of processes that were running at both samples
+        cpu_jiffies = sum(usage[0] - prev_pid_usage[pid][0] for pid, usage in pid_usage.iteritems() if pid in prev_pid_usage)
+        cpu = (100.0 * cpu_jiffies / (jiffies - prev_jiffies)) if (jiffies > prev_jiffies) else 0.0
+        mem = 100.0 * sum(usage[1] for usage in pid_usage.itervalues()) / mem_total
+        return cpu, mem
+
+
+# Last known ControlHub state on each host (keys are SSH clients; None => local): the sys.config settings
+# last written by this script, whether it's running, and the settings that were in place when it was started
+_CONTROLHUB_STATE = {}
+
+
+def _controlhub_state(ssh_client):
+    return _CONTROLHUB_STATE.setdefault(ssh_client, {'config': None, 'running': False, 'running_config': None})
 
 
 def start_controlhub(ssh_client=None):
+    """Starts ControlHub, unless this script already started it with the current sys.config (restarts it if config has since changed)"""
+    state = _controlhub_state(ssh_client)
+    if state['running']:
+        if state['running_config'] == state['config']:
+            SCRIPT_LOGGER.info('ControlHub is already running with the current sys.config, so not restarting it')
+            return
+        stop_controlhub(ssh_client)
+
     run_command("sudo controlhub_start", ssh_client=ssh_client)
+    state['running'] = True
+    state['running_config'] = state['config']
 
 
 def stop_controlhub(ssh_client=None):
     run_command("sudo controlhub_stop", ssh_client=ssh_client)
+    _controlhub_state(ssh_client)['running'] = False
     
 
+class PersistentPerfTester(object):
+    """
+    Long-lived local PerfTester.exe process (run with the -r option), that runs each PerfTester.exe command
+    line written to its stdin, so that a sequence of commands doesn't pay the cost of starting a new process
+    (or of building new clients) for each one. Can be passed to run_command in place of an SSH client.
+    The end of each command's output is marked by a sentinel line containing its exit code.
+    """
+    _SENTINEL_RE = re.compile(r"(?:^|\n)__DONE__(\d+)\n")
+
+    def __init__(self):
+        self._start()
+
+    def _start(self):
+        self._process = subprocess.Popen(['PerfTester.exe', '-r'], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, preexec_fn=os.setsid)
+        self._poller = select.poll()
+        self._poller.register(self._process.stdout, select.POLLIN)
+
+    @property
+    def pid(self):
+        return self._process.pid
+
+    def run(self, cmd, timeout=TEST_CMD_TIMEOUT_S):
+        """Runs PerfTester.exe command in the persistent process, returning tuple of exit code and stdout/err"""
+        assert cmd.startswith("PerfTester.exe ")
+
+        # Restart process if it has exited (e.g. after a failed validation test)
+        if self._process.poll() is not None:
+            self._start()
+
+        self._process.stdin.write(cmd[len("PerfTester.exe "):] + "\n")
+        self._process.stdin.flush()
+
+        t0 = time.time()
+        output = ""
+        while True:
+            m = self._SENTINEL_RE.search(output)
+            if m:
+                return int(m.group(1)), output[:m.start()]
+
+            remaining = timeout - (time.time() - t0)
+            if remaining <= 0:
+                # Process is now out of sync with the commands sent to it, so start afresh
+                self.close()
+                self._start()
+                raise CommandHardTimeout(cmd, timeout, output)
+
+            if self._poller.poll(1000 * remaining):
+                data = os.read(self._process.stdout.fileno(), 65536)
+                if not data:
+                    return self._process.wait(), output
+                output += data
+
+    def close(self):
+        if self._process.poll() is None:
+            os.killpg(self._process.pid, signal.SIGTERM)
+        self._process.wait()
+
+
+class OnlineStat(object):
+    """Running mean of a series of values, without storing the values themselves"""
+    __slots__ = ('n', 'mean')
+
+    def __init__(self):
+        self.n = 0
+        self.mean = float('nan')
+
+    def add(self, x):
+        self.n += 1
+        if self.n == 1:
+            self.mean = float(x)
+        else:
+            self.mean += (x - self.mean) / self.n
+
+
 class CommandRunner:
     """
     Class for running a set of commands in parallel - each in their own thread - whilst 
     monitoring CPU & mem usage of some other commands in the main thread.
+    Threads are taken from a pool that is re-used across calls to run.
     """
-    def __init__(self, monitoring_options):
+    def __init__(self, monitoring_options, sample_interval=0.1, persistent_perftesters=False):
         """
         Contructor. 
         The monitoring_options argument must be a list of (command_to_montor, ssh_client) tuples
+        The sample_interval argument is the time (in seconds) between CPU & mem usage samples
+        If persistent_perftesters is True, local PerfTester.exe commands are run in re-used PersistentPerfTester processes
         """
         self.monitor_opts = monitoring_options
+        self.sample_interval = sample_interval
+        self.persistent_perftesters = persistent_perftesters
+        self._pool = None
+        self._pool_size = 0
+        self._perftesters = []
 
-    def _run_in_thread(self, cmd, ssh_client, index):
+    def _run_in_thread(self, cmd, ssh_client):
         SCRIPT_LOGGER.debug('CommandRunner thread starting for command "' + cmd + '"')
         try:
-            retval = run_command(cmd, ssh_client)
-            self._cmd_completed = True
-            self.cmd_results[index] = retval
+            return run_command(cmd, ssh_client)
         except Exception as e:
             SCRIPT_LOGGER.exception('Exception of type "' + str(type(e)) + '" thrown when executing the command "' + cmd + '" in this thread.')
-            self._cmd_completed = True
-            self.cmd_results[index] = e 
-
-    def run(self, cmds):
+            raise
+        finally:
+            self._cmd_completed.set()
+
+    def _close_pool(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+            self._pool_size = 0
+
+    def close(self):
+        """Stops the threads (and persistent PerfTester.exe processes) used to run commands"""
+        self._close_pool()
+
+        for perftester in self._perftesters:
+            perftester.close()
+        self._perftesters = []
+
+    def run(self, cmds, as_array=False):
         """
         Runs the commands via ssh_client simultaneously in different threads, blocking until they are all finished.
         The argument cmds is a list of commands, or (cmd, ssh_client) tuples. If ssh_client is not specified, then command is run locally.
-        Returns a 2-tuple - element 1 is list of run_command(cmd) return values; element 2 is a list of (cmd, av_cpu, av_mem) tuples.
+        Returns a 2-tuple - element 1 is list of (cmd, av_cpu, av_mem) tuples; element 2 is list of run_command(cmd) return values.
+        If as_array is True, then the run_command return values must be equal-length tuples of numbers, and element 2 is
+        instead a 2D numpy array, with one row per command.
         """
         assert len(cmds)>0        
         SCRIPT_LOGGER.info( "CommandRunner will now run the following commands simultaneously:\n     " + "\n     ".join(cmds) )
 
-        self.cmd_results = [None for x in cmds]
-        self.threads = []
-        self._cmd_completed = False
+        self._cmd_completed = threading.Event()
+
+        # Need at least one thread per command, since all must run simultaneously
+        if len(cmds) > self._pool_size:
+            self._close_pool()
+            self._pool = ThreadPool(len(cmds))
+            self._pool_size = len(cmds)
 
         monitor_results = []
         for cmd, ssh_client in self.monitor_opts:
-            monitor_results.append( (cmd, ssh_client, [], []) )
-
-        # Set each command running
-        for i in range(len(cmds)):
-            if isinstance(cmds[i], basestring):
-                cmd = cmds[i]
+            monitor_results.append( (cmd, OnlineStat(), OnlineStat()) )
+
+        # Choose where each command is run
+        cmd_ssh_clients = []
+        perftesters_in_use = []
+        for x in cmds:
+            if isinstance(x, basestring):
+                cmd = x
                 ssh_client = None
             else:
-                cmd, ssh_client = cmds[i]
-            t = threading.Thread(target=self._run_in_thread, args=(cmd, ssh_client, i) )
-            self.threads.append(t)
+                cmd, ssh_client = x
+            if self.persistent_perftesters and (ssh_client is None) and cmd.startswith("PerfTester.exe "):
+                if len(perftesters_in_use) == len(self._perftesters):
+                    self._perftesters.append( PersistentPerfTester() )
+                ssh_client = self._perftesters[len(perftesters_in_use)]
+                perftesters_in_use.append(ssh_client)
+            cmd_ssh_clients.append( (cmd, ssh_client) )
+
+        # Stop persistent PerfTester.exe processes that these commands don't use, since their clients' idle connections would skew the usage measurements
+        for perftester in self._perftesters[len(perftesters_in_use):]:
+            perftester.close()
+        del self._perftesters[len(perftesters_in_use):]
 
-        for t in self.threads:
-            t.start()
+        # Set each command running
+        async_results = []
+        for cmd, ssh_client in cmd_ssh_clients:
+            async_results.append( self._pool.apply_async(self._run_in_thread, (cmd, ssh_client)) )
 
         # Monitor CPU/mem usage whilst *all* commands running (i.e. until any one of the commands exits)
-        time.sleep(0.4)
+        self._cmd_completed.wait(0.4)
         SCRIPT_LOGGER.debug('CommandRunner is now starting monitoring.')
-        while not self._cmd_completed:
+        samplers = []
+        for cmd, ssh_client in self.monitor_opts:
+            # Idle persistent PerfTester.exe processes mustn't be included in usage of the commands being run
+            if self._perftesters and (cmd == 'PerfTester.exe') and (ssh_client is None):
+                samplers.append( ProcessUsageSampler(cmd, pids=[str(x.pid) for x in perftesters_in_use]) )
+            else:
+                samplers.append( ProcessUsageSampler(cmd, ssh_client) )
+        while not self._cmd_completed.wait(self.sample_interval):
             try:
-                for cmd, ssh_client, cpu_vals, mem_vals in monitor_results:
-#                    SCRIPT_LOGGER.warning('Monitoring command: %s' % cmd)
-                    meas_cpu, meas_mem = cpu_mem_usage(cmd, ssh_client)
-#                    print meas_cpu, meas_mem
-                    cpu_vals.append(meas_cpu)
-                    mem_vals.append(meas_mem)
+                measurements = [sampler.sample() for sampler in samplers]
             except CommandBadExitCode as e:
-                if not self._cmd_completed:
+                if not self._cmd_completed.is_set():
                     raise
-            #time.sleep(0.02) 
-        for cmd, ssh_client, cpu_vals, mem_vals in monitor_results:
-            cpu_vals.pop()
-#            assert(len(cpu_vals) is not 0)
-            mem_vals.pop()
-#            assert(len(mem_vals) is not 0)
+                break
 
+            # Only keep these samples if no command finished whilst they were being taken
+            if self._cmd_completed.is_set():
+                break
+            for (meas_cpu, meas_mem), (cmd, cpu_stat, mem_stat) in izip(measurements, monitor_results):
+                cpu_stat.add(meas_cpu)
+                mem_stat.add(meas_mem)
 
         # Wait (without monitoring)
         SCRIPT_LOGGER.debug('One of the commands has now finished. No more monitoring - just wait for rest to finish.')
-        for t in self.threads:
-            t.join()
-            SCRIPT_LOGGER.debug("Thread with ID 0x%s has now finished. It's being removed from the list of running threads." % hex(t.ident))
-            del t
-
-        # Check for async exceptions
-        for result in self.cmd_results:
-            if issubclass(type(result), Exception):
+        for result in async_results:
+            result.wait()
+
+        # Collect results, re-raising any async exceptions
+        self.cmd_results = []
+        for result in async_results:
+            if not result.successful():
                 SCRIPT_LOGGER.error("An exception was raised in one of CommandRunner's command-running threads. Re-raising now ...")
-                raise result
+            self.cmd_results.append( result.get() )
+
+        if as_array:
+            self.cmd_results = numpy.array(self.cmd_results, dtype=numpy.float64)
 
-        return [(cmd, numpy.mean(cpu_vals), numpy.mean(mem_vals)) for cmd, ssh_client, cpu_vals, mem_vals in monitor_results], self.cmd_results
+        return [(cmd, cpu_stat.mean, mem_stat.mean) for cmd, cpu_stat, mem_stat in monitor_results], self.cmd_results
+
+    def run_with_retries(self, cmds, max_attempts=2, as_array=False):
+        """
+        Same as run, but re-runs the commands (up to max_attempts times in total) if any of them reach their hard timeout.
+        """
+        nr_attempts = 0
+        while True:
+            nr_attempts += 1
+            try: 
+                return self.run(cmds, as_array)
+            except CommandHardTimeout, e:
+                if nr_attempts < max_attempts:
+                    SCRIPT_LOGGER.warning('      Command reached hard timeout. Re-running just in case that was an error ...')
+                else:
+                    SCRIPT_LOGGER.error('      Command reached hard timeout on all %s attempts. Bailing out now ...' % (nr_attempts))
+                    raise e
 
 
 ####################################################################################################
@@ -366,6 +679,10 @@ def ssh_into(hostname, username):
         client = paramiko.SSHClient()
         client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         client.connect(hostname, username=username, password=passwd)
+        # Many small request/response exchanges (e.g. monitoring samples), so disable Nagle's algorithm; keepalive stops idle connection being dropped
+        transport = client.get_transport()
+        transport.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        transport.set_keepalive(30)
         print " SSH client now connected!"
         return client
     except paramiko.AuthenticationException, e:
@@ -374,34 +691,102 @@ def ssh_into(hostname, username):
         return ssh_into(hostname, username)
 
 
+class RemoteShell(object):
+    """
+    Persistent shell on a remote host, run over a single SSH channel, so that a sequence of commands
+    doesn't pay the cost of opening a new channel for each one. Can be passed to run_command in place
+    of an SSH client. Commands are run one at a time, and the end of each command's output is marked
+    by a sentinel line containing its exit code.
+    """
+    _SENTINEL_RE = re.compile(r"__DONE__(\d+)\n")
+
+    def __init__(self, ssh_client):
+        self.ssh_client = ssh_client
+        self._lock = threading.Lock()
+        self._open()
+
+    def _open(self):
+        self._channel = self.ssh_client.get_transport().open_session()
+        self._channel.set_combine_stderr(True)
+        self._channel.exec_command("/bin/sh")
+
+    def run(self, cmd, timeout=TEST_CMD_TIMEOUT_S):
+        """Runs command in the remote shell, returning tuple of exit code and stdout/err"""
+        with self._lock:
+            self._channel.settimeout(timeout)
+            self._channel.sendall(cmd + " ; echo __DONE__$?\n")
+
+            t0 = time.time()
+            output = ""
+            while True:
+                m = self._SENTINEL_RE.search(output)
+                if m:
+                    return int(m.group(1)), output[:m.start()]
+
+                try:
+                    data = self._channel.recv(65536)
+                except socket.timeout:
+                    data = None
+
+                if (not data) or (time.time()-t0) > timeout:
+                    # Shell is now out of sync with the commands sent to it, so start afresh
+                    self.close()
+                    self._open()
+                    raise CommandHardTimeout(cmd, timeout, output)
+
+                output += data
+
+    def close(self):
+        self._channel.close()
+
+
+
+# SFTP clients, re-used across calls; keys are SSH clients
+_SFTP_CLIENTS = {}
+
+# ControlHub sys.config contents; only parameter is max_in_flight
+_SYS_CONFIG_TEMPLATE = ('[\n'
+                        '%%%% write log files to a particular location\n'
+                        '  {sasl,\n'
+                        '    [\n'
+                        '      {sasl_error_logger, {file, "/var/log/controlhub.log"}},\n'
+                        '      {error_logger_mf_dir, "/var/log/controlhub"},\n'
+                        '      {error_logger_mf_maxbytes, 10485760},\n'
+                        '      {error_logger_mf_maxfiles, 4}\n'
+                        '    ]\n'
+                        '  },\n'
+                        '  {controlhub,\n'
+                        '    [{max_in_flight, %d}]\n'
+                        '  }\n'
+                        '].\n')
+
 
 def update_controlhub_sys_config(max_in_flight, ssh_client, sys_config_location):
-    """Writes new ControlHub sys.config file in /tmp, and copies to remote PC via SFTP."""
-    
-    content = ('[\n'
-               '%% write log files to a particular location\n'
-               '  {sasl,\n'
-               '    [\n'
-               '      {sasl_error_logger, {file, "/var/log/controlhub.log"}},\n'
-               '      {error_logger_mf_dir, "/var/log/controlhub"},\n'
-               '      {error_logger_mf_maxbytes, 10485760},\n'
-               '      {error_logger_mf_maxfiles, 4}\n'
-               '    ]\n'
-               '  },\n'
-               '  {controlhub,\n'
-               '    [{max_in_flight, ' + str(max_in_flight) + '}]\n'
-               '  }\n'
-               '].\n')
+    """Writes new ControlHub sys.config file directly to remote PC via SFTP (unless it was already written with the same settings)."""
+
+    state = _controlhub_state(ssh_client)
+    if state['config'] == (max_in_flight, sys_config_location):
+        SCRIPT_LOGGER.info('ControlHub (remote) sys.config file at "' + sys_config_location + '" already has max_in_flight=' + str(max_in_flight))
+        return
+
+    content = _SYS_CONFIG_TEMPLATE % max_in_flight
     
     SCRIPT_LOGGER.info('ControlHub (remote) sys.config file at "' + sys_config_location + '" is being updated to have max_in_flight=' + str(max_in_flight) + '. New contents is ...\n' + content)
  
-    with tempfile.NamedTemporaryFile('w+b', suffix="__ch_sys.config") as tmp_file:
-        tmp_file.write(content)
-        tmp_file.flush()
+    if ssh_client not in _SFTP_CLIENTS:
+        _SFTP_CLIENTS[ssh_client] = ssh_client.open_sftp()
 
-        sftp_client = ssh_client.open_sftp()
-        sftp_client.put(tmp_file.name, sys_config_location)
-        sftp_client.close()     
+    with _SFTP_CLIENTS[ssh_client].file(sys_config_location, 'w') as f:
+        f.write(content)
+
+    state['config'] = (max_in_flight, sys_config_location)
+
+
+def close_sftp_client(ssh_client):
+    """Closes the SFTP client re-used for the given SSH client (if one was opened)"""
+    sftp_client = _SFTP_CLIENTS.pop(ssh_client, None)
+    if sftp_client is not None:
+        sftp_client.close()
 
 
 
@@ -436,10 +821,10 @@ class DataseriesStats(object):
         return [self.rms_err_lo, self.rms_err_hi]
 
 
-def calc_y_stats(data_dict):
+def calc_y_stats(data):
+    """Returns DataseriesStats for 2D array of measurements, which has one column per x value"""
     stats = DataseriesStats()
-    for x in sorted(data_dict.keys()):
-        y_values = data_dict[x]
+    for y_values in numpy.asarray(data, dtype=numpy.float64).T:
         mean, mean_err = calc_mean_with_error(y_values)
         rms, rms_err = calc_rms_with_error(y_values)
         stats.mean.append(mean)
@@ -454,59 +839,41 @@ def calc_y_stats(data_dict):
 
 
 def calc_mean_with_error(data_list):
-    mean = numpy.mean(data_list)
-    n = len(data_list)
-    bootstrap_sample_means = []
-    for i in range(100):
-        sum = 0.0
-        for i in range(n):
-            sum += data_list[randint(0,n-1)]
-        bootstrap_sample_means.append( sum/n )
-    err = calc_rms( bootstrap_sample_means )
-    # rms = sqrt( sum([(y-mean)**2 for y in data_list]) / len(data_list) )
+    data = numpy.asarray(data_list, dtype=numpy.float64)
+    mean = data.mean()
+    # Bootstrap for error: 100 resamples drawn in one go, one per row
+    n = len(data)
+    samples = data[ numpy.random.randint(0, n, size=(100, n)) ]
+    err = samples.mean(axis=1).std()
     return mean, err
 
 
 
 def calc_rms(data_list):
-    mean = numpy.mean(data_list)
-    mean_sq_diff = sum([ (y-mean)**2 for y in data_list ]) / len(data_list)
-    return sqrt( mean_sq_diff )
+    return float( numpy.std( numpy.asarray(data_list, dtype=numpy.float64) ) )
 
 
 
 def calc_rms_with_error(data_list):
-    rms = calc_rms(data_list)
-    # Bootstrap for error
-    n = len(data_list)
-    bootstrap_sample_rms = []
-    for i in range(100):
-        min, max = 0.0, 0.0
-        sum, sum2 = 0.0, 0.0
-        for j in range(n):
-            val = data_list[randint(0,n-1)]
-            sum += val
-            sum2 += val ** 2
-            if j == 0:
-                min, max = val, val
-            elif val < min:
-                min = val
-            elif val > max:
-                max = val
-        mean = sum/n
-        if min == max or (max-min) < (1e-8 * mean):
-           bootstrap_sample_rms.append ( 0.0 )
-        else:
-           bootstrap_sample_rms.append ( sqrt(sum2/n - mean*mean) )
+    data = numpy.asarray(data_list, dtype=numpy.float64)
+    rms = calc_rms(data)
+    # Bootstrap for error: 100 resamples drawn in one go, one per row
+    n = len(data)
+    samples = data[ numpy.random.randint(0, n, size=(100, n)) ]
+    means = samples.mean(axis=1)
+    mean_sqs = (samples ** 2).mean(axis=1)
+    spreads = numpy.ptp(samples, axis=1)
+    bootstrap_sample_rms = numpy.where( (spreads == 0) | (spreads < (1e-8 * means)),
+                                        0.0,
+                                        numpy.sqrt( numpy.maximum(mean_sqs - means*means, 0.0) ) )
     err = calc_rms( bootstrap_sample_rms )
     return rms, err
 
 
 
 def measure_latency(target, controhub_ssh_client, ax):
-    '''Measures latency for single word write to given endpoint'''
-    print "\n ---> MEASURING LATENCY TO '" + target + "' <---"
-    print time.strftime('%l:%M%p %Z on %b %d, %Y')
+    '''Measures latency for single word write to given endpoint. ControlHub must already be running on the controlhub host.'''
+    SCRIPT_LOGGER.warning( " ---> MEASURING LATENCY TO '" + target + "' <---" )
 
 #    # Initialise vars to store latency measurements:
 #    lats_ping_uhal_ch, lats_ping_ch_target, lats_ping_uhal_target = [], [], []
@@ -555,22 +922,21 @@ def measure_latency(target, controhub_ssh_client, ax):
              ]
 
     ch_uri = "chtcp-2.0://" + CH_PC_NAME + ":10203?target=" + target
-    ch_tx_lats = dict((x, []) for x in depths)
-    ch_rx_lats = dict((x, []) for x in depths)
+    n_meas = 10
+    ch_tx_lats = numpy.empty((n_meas, len(depths)))
+    ch_rx_lats = numpy.empty((n_meas, len(depths)))
 
-    start_controlhub(controlhub_ssh_client)
-    for i in range(10):
-        for d in depths:
-            itns = 1000
-            ch_tx_lats[d].append( run_command("PerfTester.exe -t BandwidthTx -b 0x2001 -w "+str(d)+" -p -i "+str(itns)+" -d "+ch_uri)[0] )
-            ch_rx_lats[d].append( run_command("PerfTester.exe -t BandwidthRx -b 0x2001 -w "+str(d)+" -p -i "+str(itns)+" -d "+ch_uri)[0] )
-    stop_controlhub(controlhub_ssh_client)
+    for i in range(n_meas):
+        itns = 1000
+        ch_results = run_perftester_sweep("-t BandwidthTxRx -b 0x2001 -p -i "+str(itns), depths, ch_uri)
+        ch_tx_lats[i] = [ch_results[d][0] for d in depths]
+        ch_rx_lats[i] = [ch_results[d][2] for d in depths]
 
-    ch_tx_lats_mean, ch_tx_lats_yerrors = calc_y_with_errors(ch_tx_lats)
-    ch_rx_lats_mean, ch_rx_lats_yerrors = calc_y_with_errors(ch_rx_lats)
+    ch_tx_stats = calc_y_stats(ch_tx_lats)
+    ch_rx_stats = calc_y_stats(ch_rx_lats)
 
-    ax.errorbar(depths, ch_tx_lats_mean, yerr=ch_tx_lats_yerrors, label="Block write")
-    ax.errorbar(depths, ch_rx_lats_mean, yerr=ch_rx_lats_yerrors, label="Block read")
+    ax.errorbar(depths, ch_tx_stats.mean, yerr=ch_tx_stats.mean_errors(), label="Block write")
+    ax.errorbar(depths, ch_rx_stats.mean, yerr=ch_rx_stats.mean_errors(), label="Block read")
 
     ax.set_xlabel("Number of words")
     ax.set_ylabel("Mean latency [us]")
@@ -582,7 +948,8 @@ def measure_latency(target, controhub_ssh_client, ax):
 def measure_1_to_1_latency(target, controlhub_ssh_client, n_meas, max_depth, pkt_depths):
     '''
     Measures latencies for block reads & writes to given endpoint, and 
-    returns structured array containing latencies in micro-sec
+    returns structured array containing latencies in micro-sec.
+    ControlHub must already be running on the controlhub host.
 
     Arguments:
       target                 --  target hostname (or IP) & port in format "hostname:port"
@@ -590,8 +957,7 @@ def measure_1_to_1_latency(target, controlhub_ssh_client, n_meas, max_depth, pkt
       n_meas                 --  number of measurements to take at each depth
     '''
 
-    print "\n ---> MEASURING 1 to 1 performance vs DEPTH to '" + target + "' <---"
-    print time.strftime('%l:%M%p %Z on %b %d, %Y')
+    SCRIPT_LOGGER.warning( " ---> MEASURING 1 to 1 performance vs DEPTH to '" + target + "' <---" )
 
     depths = [1]
     depths += [50, 100, 150, 200, 300, 500, 600, 800, 1000]
@@ -604,8 +970,8 @@ def measure_1_to_1_latency(target, controlhub_ssh_client, n_meas, max_depth, pkt
     for n in [2e3, 3e3, 4e3, 7e3, 10e3]:
         depths += [3*n*min(pkt_depths)]
 
-    depths.sort()
-    depths = filter(lambda x: x<=max_depth, depths)
+    # Drop duplicates, since the sweep results are keyed by depth
+    depths = sorted(set(d for d in depths if d<=max_depth))
 
     data = numpy.zeros(len(depths), 
                     dtype=[('w','uint32'),
@@ -618,11 +984,7 @@ def measure_1_to_1_latency(target, controlhub_ssh_client, n_meas, max_depth, pkt
                           ]
                    )
 
-    for i in range(len(depths)):
-        data['w'][i] = int(depths[i])
-
-    update_controlhub_sys_config(CH_MAX_IN_FLIGHT, controlhub_ssh_client, CH_SYS_CONFIG_LOCATION)
-    start_controlhub(controlhub_ssh_client)
+    data['w'] = depths
 
     udp_uri = "ipbusudp-2.0://" + target
     ch_uri  = "chtcp-2.0://" + CH_PC_NAME + ":10203?target=" + target
@@ -630,20 +992,11 @@ def measure_1_to_1_latency(target, controlhub_ssh_client, n_meas, max_depth, pkt
     for i in range(n_meas):
         SCRIPT_LOGGER.warning('1-to-1 measurements: iteration %d' % i)
 
-        for entry in data:
-            cmd_tx = "PerfTester.exe -t BandwidthTx -b 0x2001 -w " + str(entry['w']) + " -p -i 1 -d "
-            cmd_rx = cmd_tx.replace("BandwitdthTx", "BandwidthRx")
-
-#            entry['udp_tx'][i] = run_command( cmd_tx + udp_uri )[0]
-#            entry['udp_tx_1itn'][i] = run_command( cmd_tx.replace('-i 10', '-i 1') + udp_uri )[0]
-#            entry['udp_rx'][i] = run_command( cmd_rx + udp_uri )[0]
-            entry['ch_tx'][i]  = run_command( cmd_tx + ch_uri  )[0]
-#            entry['ch_tx_10itn'][i] = run_command( cmd_tx.replace('-i 1', '-i 10') + ch_uri )[0]
-            entry['ch_rx'][i]  = run_command( cmd_rx + ch_uri  )[0]
-
+        ch_results = run_perftester_sweep("-t BandwidthTxRx -b 0x2001 -p -i 1", data['w'], ch_uri)
 
-    # Final cleanup
-    stop_controlhub(controlhub_ssh_client)
+        for entry in data:
+            entry['ch_tx'][i]  = ch_results[entry['w']][0]
+            entry['ch_rx'][i]  = ch_results[entry['w']][2]
 
     return data
 
@@ -651,7 +1004,8 @@ def measure_1_to_1_latency(target, controlhub_ssh_client, n_meas, max_depth, pkt
 
 def random_sample(src, N=None, transform=lambda x: x):
     '''
-    Returns a random sample of length N, generated by randomly picking elements of src
+    Returns a random sample of length N (or of shape N, if N is a tuple), generated by randomly picking elements of src.
+    The transform is applied to the whole array of picked elements, so must work elementwise on numpy arrays.
     '''
     assert isinstance(src, numpy.ndarray)
     assert hasattr(transform, '__call__')
@@ -659,30 +1013,29 @@ def random_sample(src, N=None, transform=lambda x: x):
     if N is None:
         N = len(src)
 
-    result = numpy.zeros(N, src.dtype)
-    for i in range(len(result)):
-        result[i] = transform( src[ numpy.random.randint(len(src)) ] )
-    return result
+    return numpy.asarray(transform( src[ numpy.random.randint(len(src), size=N) ] ), dtype=src.dtype)
 
 
 
 def calc_percentiles(sample, fractions):
     '''
-    Returns the positions of the percentile 'fraction' within this sample
-    NOTA BENE ... CURRENT IMPLEMENTATION SORTS sample IN PLACE.
+    Returns the positions of the percentile 'fraction' within this sample.
+    If sample has more than one dimension, the percentiles are calculated along its last axis.
     '''
     assert isinstance(sample, numpy.ndarray)
     assert isinstance(fractions, list)
     for f in fractions:
         assert (f > 0.0) and (f < 1.0)
-    sample.sort() # In place sort => changes the argument
-    result = numpy.zeros(len(fractions), 'float32')
-    for i, f in enumerate(fractions):
-        frac_as_index = f * ( len(sample) - 1 )
-        low_index  = int(frac_as_index)
-        high_index = low_index + 1
-        result[i] = sample[low_index] + (frac_as_index - low_index) * (sample[high_index] - sample[low_index])
-    return result
+
+    frac_as_index = numpy.asarray(fractions) * ( sample.shape[-1] - 1 )
+    low_index  = frac_as_index.astype(int)
+    high_index = low_index + 1
+
+    # Only the elements either side of each percentile need to be in their sorted positions, so partition rather than sort
+    partitioned = numpy.partition(sample, numpy.union1d(low_index, high_index), axis=-1)
+    low_values  = partitioned[..., low_index]
+    result = low_values + (frac_as_index - low_index) * (partitioned[..., high_index] - low_values)
+    return result.astype('float32')
 
 
 
@@ -700,10 +1053,16 @@ def bootstrap_percentile(measurements, fractions, N=100, transform=lambda x: x):
 #    assert ( f > 0.0 ) and ( f < 1.0 )
     assert isinstance(N, int)
 
-    bootstrap_pc_struct = numpy.zeros(N, str(len(fractions))+'float32')
-    for i in range(len(bootstrap_pc_struct)):
-        sample = random_sample( measurements, transform=transform )
-        bootstrap_pc_struct[i] = calc_percentiles(sample, fractions)
+    # With 0 or 1 measurements every bootstrap sample would be identical (or empty), so skip resampling
+    if len(measurements) == 0:
+        return [(numpy.nan, numpy.nan) for f in fractions]
+    elif len(measurements) == 1:
+        value = float(numpy.asarray(transform(measurements), dtype=measurements.dtype)[0])
+        return [(value, 0.0) for f in fractions]
+
+    # All N bootstrap samples drawn at once, one per row
+    samples = random_sample( measurements, N=(N, len(measurements)), transform=transform )
+    bootstrap_pc_struct = calc_percentiles(samples, fractions)
 
     return [(numpy.mean(bootstrap_pc_values), calc_rms( bootstrap_pc_values))
              for bootstrap_pc_values 
@@ -740,10 +1099,9 @@ def bootstrap_stats_array( raw_data, transforms=None ):
          (stats_struct['84_est'], stats_struct['84_err']),
         ] = bootstrap_percentile(values, [0.16, 0.50, 0.84], transform=transform)
 
-    for i in range(len(result)):
-        for pc in ['16', '84']:
-            result[pc+'_est_rel2median'][i] = ( result[pc+'_est'][i] / result['50_est'][i] )
-            result[pc+'_err_rel2median'][i] = ( result[pc+'_err'][i] / result['50_est'][i] )
+    for pc in ['16', '84']:
+        result[pc+'_est_rel2median'] = result[pc+'_est'] / result['50_est']
+        result[pc+'_err_rel2median'] = result[pc+'_err'] / result['50_est']
 
     return result
 
@@ -756,8 +1114,7 @@ def plot_1_to_1_performance( all_data , key_label_pairs , words_per_pkt ):
     Arguments:
       data  --  
     '''
-    print "\n ---> PLOTTING LATENCY/BANDWIDTH vs DEPTH <---"
-    print time.strftime('%l:%M%p %Z on %b %d, %Y')
+    SCRIPT_LOGGER.warning( " ---> PLOTTING LATENCY/BANDWIDTH vs DEPTH <---" )
 
     ## Set up graphs ...
     ## sharex: Makes x axes of plots have same limits
@@ -798,14 +1155,16 @@ def plot_1_to_1_performance( all_data , key_label_pairs , words_per_pkt ):
     # Calc stats for each line, and then plot
 
     depths = all_data['w']
+    # Bandwidth [Gbit/s] = 32 bits per word * depth / latency [us], as column vector to broadcast across measurements
+    bits_per_depth = 1e-3 * 32.0 * depths[:,numpy.newaxis]
 
     lat_mask = depths < 1001
 
     for key, label in key_label_pairs:
-        print key, "--", label
+        SCRIPT_LOGGER.warning( key + ' -- ' + label )
 
         stats = bootstrap_stats_array( all_data[key] )
-        bw_stats = bootstrap_stats_array( all_data[key], transforms=[(lambda x, d=d: 1e-3 * 32 * d / x) for d in depths] )
+        bw_stats = bootstrap_stats_array( bits_per_depth / all_data[key] )
 
         col = ax_lat1.errorbar(depths[lat_mask], stats['50_est'][lat_mask], yerr=(stats['50_err'][lat_mask]), label=label)[0].get_color()
 
@@ -869,8 +1228,9 @@ def plot_1_to_1_performance( all_data , key_label_pairs , words_per_pkt ):
 def measure_n_to_m(targets, controlhub_ssh_client, n_meas, f_words, bw=True, write=True, nrs_clients=[1]):
     '''
     Measures continuous block-write bandwidth from to all endpoints, varying the number of clients.
+    ControlHub must already be running on the controlhub host.
     '''
-    print "\n ---> " + ("BANDWIDTH" if bw else "LATENCY") + (" (write)" if write else " (read)") + " vs NR_CLIENTS to", targets, "<---"
+    SCRIPT_LOGGER.warning( " ---> " + ("BANDWIDTH" if bw else "LATENCY") + (" (write)" if write else " (read)") + " vs NR_CLIENTS to " + str(targets) + " <---" )
 
     nrs_targets = range(1, len(targets)+1)
 
@@ -886,60 +1246,56 @@ def measure_n_to_m(targets, controlhub_ssh_client, n_meas, f_words, bw=True, wri
                               ('uhal_mem',  'float32', (n_meas,) ),
                              ]
                       )
-    for i in range(len(targets)):
-        data[i]['n_targets'] = nrs_targets[i]
-        for j in range(len(nrs_clients)):
-            data[i]['n_clients'][j] = nrs_clients[j]
+    # Rows correspond to numbers of targets, columns to numbers of clients
+    data['n_targets'] = numpy.asarray(nrs_targets)[:,numpy.newaxis]
+    data['n_clients'] = nrs_clients
 
     # Run commands for measurements
 
-    cmd_base = "PerfTester.exe"
-    cmd_base += " -t BandwidthTx" if write else " -t BandwidthRx"
-    cmd_base += " -i 1" if bw else " -p -w 1 "
-    cmd_base += " -d chtcp-2.0://" + CH_PC_NAME + ":10203?target="
-
-    cmd_runner = CommandRunner( [('PerfTester.exe',None), ('beam.smp',controlhub_ssh_client)] )
-
-    update_controlhub_sys_config(CH_MAX_IN_FLIGHT, controlhub_ssh_client, CH_SYS_CONFIG_LOCATION)
-    start_controlhub(controlhub_ssh_client)
-
-    for i in range(n_meas):
-        SCRIPT_LOGGER.warning( '--> Iteration %d of %d' % (i+1, n_meas) )
-        for subdata in data:
-            for entry in subdata:
-                n_clients, n_targets = entry['n_clients'], entry['n_targets']
-                n_words = int(f_words(n_clients, n_targets)) if hasattr(f_words,'__call__') else f_words
-                SCRIPT_LOGGER.warning( '     %d, %d   (%d words)' % (n_clients, n_targets, n_words) )
-                
-                if bw: 
-                    cmd_suffix = ' -w ' + str( n_words / ( n_clients * n_targets ) )
-                else:
-                    cmd_suffix = ' -i ' + str( n_words if ( (n_clients * n_targets) < 3) else n_words/2 )
+    # Template for commands; n is depth for bandwidth measurements, or nr of iterations for latency measurements
+    cmd_template = "PerfTester.exe -m"
+    cmd_template += " -t BandwidthTx" if write else " -t BandwidthRx"
+    cmd_template += " -i 1 -w {n}" if bw else " -p -w 1 -i {n}"
+    cmd_template += " -d chtcp-2.0://" + CH_PC_NAME + ":10203?target={target}"
 
-                cmds = [cmd_base + t + cmd_suffix for t in targets[0:n_targets] for x in range(n_clients)]
+    # Commands only depend on numbers of clients & targets (not iteration), so build them once
+    cmds_by_config = {}
+    for n_targets in nrs_targets:
+        for n_clients in nrs_clients:
+            n_words = int(f_words(n_clients, n_targets)) if hasattr(f_words,'__call__') else f_words
 
-                nr_attempts = 0
-                while True:
-                    nr_attempts += 1
-                    try: 
-                        monitor_results, cmd_results = cmd_runner.run(cmds)
-                        break
-                    except CommandHardTimeout, e:
-                        if nr_attempts < 2:
-                            SCRIPT_LOGGER.warning('      Command reached hard timeout. Re-running just in case that was an error ...')
-                        else:
-                            SCRIPT_LOGGER.error('      Command reached hard timeout on all %s attempts. Bailing out now ...' % (nr_attempts))
-                            raise e
+            if bw: 
+                n = n_words / ( n_clients * n_targets )
+            else:
+                n = n_words if ( (n_clients * n_targets) < 3) else n_words/2
 
-                bws = [ x[1] for x in cmd_results ]
+            cmds = [cmd_template.format(n=n, target=t) for t in targets[0:n_targets] for x in range(n_clients)]
+            cmds_by_config[(n_clients, n_targets)] = (n_words, cmds)
 
-                entry['y'][i] = sum([ x[1] for x in cmd_results]) if bw else numpy.median([x[0] for x in cmd_results])
-                entry['ch_cpu'][i]   = monitor_results[1][1]
-                entry['ch_mem'][i]   = monitor_results[1][2]
-                entry['uhal_cpu'][i] = monitor_results[0][1]
-                entry['uhal_mem'][i] = monitor_results[0][2]
+    # ControlHub monitoring samples are run in a persistent shell, rather than opening a new SSH channel for each
+    ch_shell = RemoteShell(controlhub_ssh_client)
+    cmd_runner = CommandRunner( [('PerfTester.exe',None), ('beam.smp',ch_shell)], persistent_perftesters=True )
 
-    stop_controlhub(controlhub_ssh_client)
+    try:
+        for i in range(n_meas):
+            SCRIPT_LOGGER.warning( '--> Iteration %d of %d' % (i+1, n_meas) )
+            for subdata in data:
+                for entry in subdata:
+                    n_clients, n_targets = int(entry['n_clients']), int(entry['n_targets'])
+                    n_words, cmds = cmds_by_config[(n_clients, n_targets)]
+                    SCRIPT_LOGGER.warning( '     %d, %d   (%d words)' % (n_clients, n_targets, n_words) )
+
+                    # Rows of cmd_results are (latency, bandwidth) of each client
+                    monitor_results, cmd_results = cmd_runner.run_with_retries(cmds, as_array=True)
+
+                    entry['y'][i] = cmd_results[:,1].sum() if bw else numpy.median(cmd_results[:,0])
+                    entry['ch_cpu'][i]   = monitor_results[1][1]
+                    entry['ch_mem'][i]   = monitor_results[1][2]
+                    entry['uhal_cpu'][i] = monitor_results[0][1]
+                    entry['uhal_mem'][i] = monitor_results[0][2]
+    finally:
+        cmd_runner.close()
+        ch_shell.close()
 
     return data
 
@@ -949,17 +1305,13 @@ def plot_n_to_m(data_label_list, bw=True, write=True):
     if isinstance( data_label_list, numpy.ndarray ):
         data_label_list = [(data_label_list, "{0} clients")]
     assert isinstance(data_label_list, list)
-    assert all(map(lambda x: (isinstance(x,tuple) and len(x) is 2), data_label_list))
+    assert all((isinstance(x,tuple) and len(x) == 2) for x in data_label_list)
 
     # Set up figures ...
 
-    fig = plt.figure(figsize=(15,8))
-    ax_bw_total = fig.add_subplot(231)
-    ax_bw_board = fig.add_subplot(234, sharex=ax_bw_total)
-    ax_ch_cpu   = fig.add_subplot(232, sharex=ax_bw_total)
-    ax_ch_mem   = fig.add_subplot(235, sharex=ax_bw_total)
-    ax_uhal_cpu = fig.add_subplot(233, sharex=ax_bw_total)
-    ax_uhal_mem = fig.add_subplot(236, sharex=ax_bw_total, sharey=ax_ch_mem)
+    # All axes created in one call
+    fig, ((ax_bw_total, ax_ch_cpu, ax_uhal_cpu), (ax_bw_board, ax_ch_mem, ax_uhal_mem)) = plt.subplots(2, 3, sharex=True, figsize=(15,8))
+    ax_ch_mem.get_shared_y_axes().join(ax_ch_mem, ax_uhal_mem)
 
     fig.subplots_adjust(left=.06, right=.98, bottom=.07, top=.96)
     fig.canvas.set_window_title('600MB continuous write/read to crate' if bw else 'Polling: multiple clients and targets')
@@ -973,7 +1325,7 @@ def plot_n_to_m(data_label_list, bw=True, write=True):
       for data_subset in numpy.swapaxes(all_data, 0, 1):
         nrs_targets = data_subset['n_targets']
         n_clients = data_subset['n_clients'][0]
-        assert all(map(lambda x: x == n_clients, data_subset['n_clients']))
+        assert (data_subset['n_clients'] == n_clients).all()
 
         label = label_format.format(n_clients)
 
@@ -991,10 +1343,10 @@ def plot_n_to_m(data_label_list, bw=True, write=True):
         ax_uhal_mem.errorbar(nrs_targets, uhal_mem_stats['50_est'], yerr=uhal_mem_stats['50_err'], label=label)
 
         if bw:
-            bw_per_tgt_stats = bootstrap_stats_array( data_subset['y'], transforms=[(lambda bw, f=n: bw / f) for n in nrs_targets])
+            bw_per_tgt_stats = bootstrap_stats_array( data_subset['y'] / nrs_targets[:,numpy.newaxis] )
             ax_bw_board.errorbar( nrs_targets, bw_per_tgt_stats['50_est'], yerr=bw_per_tgt_stats['50_err'], label=label)
         else:
-            freq_stats = bootstrap_stats_array( data_subset['y'], transforms=[(lambda x, f=n*n_clients: f * 1e3 / x) for n in nrs_targets])
+            freq_stats = bootstrap_stats_array( (1e3 * n_clients * nrs_targets[:,numpy.newaxis]) / data_subset['y'] )
             ax_bw_board.errorbar( nrs_targets, freq_stats['50_est'], yerr=freq_stats['50_err'], label=label)
 #        if bw:
 #            bw_board_50est = numpy.divide( bw_stats['50_est'], n_clients )
@@ -1003,8 +1355,8 @@ def plot_n_to_m(data_label_list, bw=True, write=True):
         
     # Labels
 
-    for ax in [ax_bw_board, ax_bw_total, ax_ch_cpu, ax_ch_mem, ax_uhal_cpu, ax_uhal_mem]:
-        ax.set_xlabel('Number of targets')
+    # Top row has no x tick labels (shared x axes), so only label the bottom row
+    plt.setp([ax_bw_board, ax_ch_mem, ax_uhal_mem], xlabel='Number of targets')
     if bw:
         ax_bw_board.set_ylabel('Throughput per target [Gbit/s]')
         ax_bw_total.set_ylabel('Total throughput [Gbit/s]')
@@ -1019,14 +1371,9 @@ def plot_n_to_m(data_label_list, bw=True, write=True):
 
      # Limits
 
-    for ax in [ax_bw_board, ax_bw_total]:
-        ax.set_xlim(numpy.min(data_subset['n_targets']))
-        ax.set_ylim(0)
-
-    for ax in [ax_ch_cpu, ax_uhal_cpu]:
-        ax.set_ylim(0,400)
-    for ax in [ax_ch_mem, ax_uhal_mem]:
-        ax.set_ylim(0)
+    plt.setp([ax_bw_board, ax_bw_total], xlim=numpy.min(data_subset['n_targets']), ylim=0)
+    plt.setp([ax_ch_cpu, ax_uhal_cpu], ylim=(0,400))
+    plt.setp([ax_ch_mem, ax_uhal_mem], ylim=0)
 
     ax_bw_total.legend(loc='best', fancybox=True)
 
@@ -1042,6 +1389,7 @@ def measure_1_to_1_vs_pktLoss(target, controlhub_ssh_client, n_meas=10, depth=1,
     '''
     Measures latencies for single-word reads as function of fractional send/receive UDP packet loss on controlhub host.
     Returns structured array containing latencies in micro-secs.
+    ControlHub must already be running on the controlhub host.
 
     Arguments:
       target                 --  target hostname (or IP) & port in format "hostname:port"
@@ -1049,8 +1397,7 @@ def measure_1_to_1_vs_pktLoss(target, controlhub_ssh_client, n_meas=10, depth=1,
       n_meas                 --  number of measurements to take for each fractional 
     '''
 
-    print "\n ---> MEASURING 1 to 1 performance vs fractionsl packet loss to '" + target + "' <---"
-    print time.strftime('%l:%M%p %Z on %b %d, %Y')
+    SCRIPT_LOGGER.warning( " ---> MEASURING 1 to 1 performance vs fractionsl packet loss to '" + target + "' <---" )
 
     data = numpy.zeros(len(fractions), 
                        dtype=[('f','float32'),
@@ -1058,14 +1405,12 @@ def measure_1_to_1_vs_pktLoss(target, controlhub_ssh_client, n_meas=10, depth=1,
                              ]
                       )
 
-    print fractions
-    for i in range(len(fractions)):
-        data['f'][i] = fractions[i]
+    SCRIPT_LOGGER.warning( 'Fractional packet losses: ' + str(fractions) )
+    data['f'] = fractions
 
-    update_controlhub_sys_config(CH_MAX_IN_FLIGHT, controlhub_ssh_client, CH_SYS_CONFIG_LOCATION)
-    start_controlhub(controlhub_ssh_client)
+    ch_shell = RemoteShell(controlhub_ssh_client)
 
-    cmd = 'PerfTester.exe -t BandwidthRx -b 0x2001 -w %d -i 10000 -p -d chtcp-2.0://%s:10203?target=%s' % (depth, CH_PC_NAME, target)
+    cmd = 'PerfTester.exe -m -t BandwidthRx -b 0x2001 -w %d -i 10000 -p -d chtcp-2.0://%s:10203?target=%s' % (depth, CH_PC_NAME, target)
     cmd_fmt_add_pkt_loss = 'sudo /sbin/iptables -I {0} -p udp -m statistic --mode random --probability {1} -j DROP'
     cmd_fmt_del_pkt_loss = 'sudo /sbin/iptables -D {0} 1'
 
@@ -1076,17 +1421,17 @@ def measure_1_to_1_vs_pktLoss(target, controlhub_ssh_client, n_meas=10, depth=1,
             f = entry['f']
 
             if f != 0.0:
-                run_command( cmd_fmt_add_pkt_loss.format('INPUT', f), controlhub_ssh_client )
-                run_command( cmd_fmt_add_pkt_loss.format('OUTPUT', f), controlhub_ssh_client )
+                run_command( cmd_fmt_add_pkt_loss.format('INPUT', f), ch_shell )
+                run_command( cmd_fmt_add_pkt_loss.format('OUTPUT', f), ch_shell )
 
             entry['latency'][i] = run_command(cmd)[0]
 
             if f != 0.0:
-                run_command( cmd_fmt_del_pkt_loss.format('INPUT'), controlhub_ssh_client )
-                run_command( cmd_fmt_del_pkt_loss.format('OUTPUT'), controlhub_ssh_client )
+                run_command( cmd_fmt_del_pkt_loss.format('INPUT'), ch_shell )
+                run_command( cmd_fmt_del_pkt_loss.format('OUTPUT'), ch_shell )
 
     # Final cleanup
-    stop_controlhub(controlhub_ssh_client)
+    ch_shell.close()
 
     return data
 
@@ -1124,8 +1469,7 @@ def plot_1_to_1_vs_pktLoss(data):
 ############################################################################################################
 
 def meas_ipbus_extern_performance( target, ch_ssh_client, nrs_in_flight, n_meas):
-    print "\n ---> MEASURING IPbus throughput vs number in flight from fixed-packet boost/Erlang clients to '" + target + "' <---"
-    print time.strftime('%l:%M%p %Z on %b %d, %Y')
+    SCRIPT_LOGGER.warning( " ---> MEASURING IPbus throughput vs number in flight from fixed-packet boost/Erlang clients to '" + target + "' <---" )
 
     data = numpy.zeros(len(nrs_in_flight), 
                        dtype=[('n','uint8'),
@@ -1134,9 +1478,8 @@ def meas_ipbus_extern_performance( target, ch_ssh_client, nrs_in_flight, n_meas)
                              ]
                       )
 
-    print nrs_in_flight
-    for i in range(len(nrs_in_flight)):
-        data['n'][i] = nrs_in_flight[i]
+    SCRIPT_LOGGER.warning( 'Numbers in flight: ' + str(nrs_in_flight) )
+    data['n'] = nrs_in_flight
 
     base_cmd_erl = ('/cactusbuild/tswsvn/network-examples/network_client.escript udp '
                      + '/cactusbuild/tswsvn/network-examples/data/ipbus2_pramWrite_send.dat' 
@@ -1147,6 +1490,8 @@ def meas_ipbus_extern_performance( target, ch_ssh_client, nrs_in_flight, n_meas)
                      + ' /cactusbuild/tswsvn/network-examples/data/ipbus2_pramWrite_send.dat' 
                      + ' /cactusbuild/tswsvn/network-examples/data/ipbus2_pramWrite_recv.dat')
 
+    ch_shell = RemoteShell(ch_ssh_client)
+
     for i in range(n_meas):
         SCRIPT_LOGGER.warning('IPbus Erlang/boost measurements: iteration %d of %d' % (i+1,n_meas) )
  
@@ -1154,8 +1499,10 @@ def meas_ipbus_extern_performance( target, ch_ssh_client, nrs_in_flight, n_meas)
             n = entry['n']
             suffix = ' ' + str(6000*min(n,12))+ ' ' + str(n)
 
-            entry['erlang'][i] = run_command( base_cmd_erl + suffix, ch_ssh_client, parser=parse_fixed_packet_client)[1]
-            entry['boost'][i]  = run_command( base_cmd_cpp + suffix, ch_ssh_client, parser=parse_fixed_packet_client)[1]
+            entry['erlang'][i] = run_command( base_cmd_erl + suffix, ch_shell, parser=parse_fixed_packet_client)[1]
+            entry['boost'][i]  = run_command( base_cmd_cpp + suffix, ch_shell, parser=parse_fixed_packet_client)[1]
+
+    ch_shell.close()
 
     return data
 
@@ -1192,8 +1539,7 @@ def plot_ipbus_extern_performance(data, key_label_pairs):
 ############################################################################################################
 
 def meas_echo_full_frame_performance( target, ch_ssh_client, nrs_in_flight, n_meas):
-    print "\n ---> MEASURING Echo throughput vs number in flight from fixed-packet boost/Erlang clients to '" + target + "' <---"
-    print time.strftime('%l:%M%p %Z on %b %d, %Y')
+    SCRIPT_LOGGER.warning( " ---> MEASURING Echo throughput vs number in flight from fixed-packet boost/Erlang clients to '" + target + "' <---" )
 
     data = numpy.zeros(len(nrs_in_flight), 
                        dtype=[('n','uint8'),
@@ -1203,8 +1549,7 @@ def meas_echo_full_frame_performance( target, ch_ssh_client, nrs_in_flight, n_me
                              ]
                       )
 
-    for i in range(len(nrs_in_flight)):
-        data['n'][i] = nrs_in_flight[i]
+    data['n'] = nrs_in_flight
 
 
     base_cmd_udp_erl = ('/cactusbuild/tswsvn/network-examples/network_client.escript udp '
@@ -1293,8 +1638,7 @@ def plot_echo_full_frame_performance(data, key_label_pairs):
 ############################################################################################################
 
 def meas_echo_performance_vs_size( target, ch_ssh_client, sizes, n_meas):
-    print "\n ---> MEASURING Echo throughput vs size from fixed-packet boost/Erlang clients to '" + target + "' <---"
-    print time.strftime('%l:%M%p %Z on %b %d, %Y')
+    SCRIPT_LOGGER.warning( " ---> MEASURING Echo throughput vs size from fixed-packet boost/Erlang clients to '" + target + "' <---" )
 
     data = numpy.zeros(len(sizes), 
                        dtype=[('size','uint32'),
@@ -1302,8 +1646,7 @@ def meas_echo_performance_vs_size( target, ch_ssh_client, sizes, n_meas):
                              ]
                       )
 
-    for i in range(len(sizes)):
-        data['size'][i] = sizes[i]
+    data['size'] = sizes
 
 
     # Start servers 
@@ -1392,24 +1735,32 @@ def take_measurements(file_prefix, multiple_in_flight, externs):
     else:
         ifmultiple = lambda a,b: a if multiple_in_flight else b
 
-        data['1_to_1_latency'] = measure_1_to_1_latency( TARGETS[0], 
-                                                         ch_ssh_client, 
-                                                         n_meas = 100, 
-                                                         max_depth = ifmultiple(1e7,1e4),
-                                                         pkt_depths = ifmultiple([342,343], [250])
-                                                       )
-
-        data['1_to_1_vs_pktLoss'] = measure_1_to_1_vs_pktLoss( TARGETS[0], ch_ssh_client, n_meas=10 )
+        # Same ControlHub configuration is used for all measurements, so only start it once
+        update_controlhub_sys_config(CH_MAX_IN_FLIGHT, ch_ssh_client, CH_SYS_CONFIG_LOCATION)
+        start_controlhub(ch_ssh_client)
 
-        data['n_to_m_lat'] = measure_n_to_m( TARGETS, ch_ssh_client, n_meas=4,
-                                             f_words=lambda n,m: 3e4 / (1. + (n*m)*17./215.),
-                                             bw=False, write=False,
-                                             nrs_clients=[1,2,4]
-                                           )
-
-        n_words = ifmultiple(600,50) * 1000 * 1000 / 4
-        data['n_to_m_bw_rx'] = measure_n_to_m( TARGETS, ch_ssh_client, n_meas=ifmultiple(4,3), f_words=n_words, write=False, nrs_clients=[1] )
-        data['n_to_m_bw_tx'] = measure_n_to_m( TARGETS, ch_ssh_client, n_meas=ifmultiple(4,3), f_words=n_words, write=True,  nrs_clients=[1] )
+        try:
+            data['1_to_1_latency'] = measure_1_to_1_latency( TARGETS[0], 
+                                                             ch_ssh_client, 
+                                                             n_meas = 100, 
+                                                             max_depth = ifmultiple(1e7,1e4),
+                                                             pkt_depths = ifmultiple([342,343], [250])
+                                                           )
+
+            data['1_to_1_vs_pktLoss'] = measure_1_to_1_vs_pktLoss( TARGETS[0], ch_ssh_client, n_meas=10 )
+
+            data['n_to_m_lat'] = measure_n_to_m( TARGETS, ch_ssh_client, n_meas=4,
+                                                 f_words=lambda n,m: 3e4 / (1. + (n*m)*17./215.),
+                                                 bw=False, write=False,
+                                                 nrs_clients=[1,2,4]
+                                               )
+
+            n_words = ifmultiple(600,50) * 1000 * 1000 / 4
+            data['n_to_m_bw_rx'] = measure_n_to_m( TARGETS, ch_ssh_client, n_meas=ifmultiple(4,3), f_words=n_words, write=False, nrs_clients=[1] )
+            data['n_to_m_bw_tx'] = measure_n_to_m( TARGETS, ch_ssh_client, n_meas=ifmultiple(4,3), f_words=n_words, write=True,  nrs_clients=[1] )
+        finally:
+            stop_controlhub(ch_ssh_client)
+            close_sftp_client(ch_ssh_client)
 
         data['end_time'] = time.localtime()
 
@@ -1474,7 +1825,11 @@ def make_plots(input_file, externs):
         else:
            print 'Invalid answer. Please type "y", "yes", "n", or "no" ...'
 
-    plt.show()
+    if matplotlib.get_backend().lower() == 'agg':
+        for fig, suffix in plots:
+            plt.close(fig)
+    else:
+        plt.show()
 
 
 
@@ -37,6 +37,7 @@
 // C++ headers
 #include <iostream>
 #include <iomanip>
+#include <iterator>
 #include <sstream>
 #include <cstdlib>
 #include <unistd.h>
@@ -68,9 +69,13 @@ uhal::tests::PerfTester::PerfTester() :
   m_baseAddrStr ( "0x0" ),
   m_baseAddr ( 0 ),
   m_bandwidthTestDepth ( 0 ),
+  m_sweepDepths(),
   m_verbose ( false ),
   m_perIterationDispatch ( false ),
-  m_includeConnect ( false )
+  m_includeConnect ( false ),
+  m_machineOutput ( false ),
+  m_readingStdin ( false ),
+  m_clientCache()
 {
   // ***** DECLARE TESTS HERE - descriptions should not be longer than a shortish line. *****:
   // Receive bandwidth test
@@ -79,6 +84,9 @@ uhal::tests::PerfTester::PerfTester() :
   // Transmit bandwidth test
   m_testFuncMap["BandwidthTx"] = &PerfTester::bandwidthTxTest;
   m_testDescMap["BandwidthTx"] = "Block write test (default depth = 340) to find the transmit bandwidth.";
+  // Transmit & receive bandwidth test
+  m_testFuncMap["BandwidthTxRx"] = &PerfTester::bandwidthTxRxTest;
+  m_testDescMap["BandwidthTxRx"] = "BandwidthTx test followed by BandwidthRx test, using the same clients.";
   // Validation test
   m_testFuncMap["Validation"] = &PerfTester::validationTest;
   m_testDescMap["Validation"] = "For validating downstream subsystems, such as the Control Hub or the IPbus firmware.";
@@ -95,6 +103,13 @@ int uhal::tests::PerfTester::run ( int argc, char* argv[] )
 {
   try
   {
+    // Reset options that have no default value, since run is called once per line in stdin mode
+    m_deviceURIs.clear();
+    m_sweepDepths.clear();
+    m_verbose = false;
+    m_perIterationDispatch = false;
+    m_includeConnect = false;
+    m_machineOutput = false;
     // This just defines and parses the command line parameters that are allowed.
     po::options_description argDescriptions ( "Allowed options" );
     argDescriptions.add_options()
@@ -106,8 +121,11 @@ int uhal::tests::PerfTester::run ( int argc, char* argv[] )
     ( "devices,d", po::value<StringVec> ( &m_deviceURIs )->multitoken(), "List of device connection URIs, e.g. chtcp-1.3://..., etc" )
     ( "baseAddr,b", po::value<string> ( &m_baseAddrStr )->default_value ( "0x0" ), "Base address (in hex) of the test location on the target device(s)." )
     ( "bandwidthTestDepth,w", po::value<boost::uint32_t> ( &m_bandwidthTestDepth )->default_value ( 340 ), "Depth of read/write used in bandwidth tests." )
+    ( "sweepDepths,s", po::value< std::vector<boost::uint32_t> > ( &m_sweepDepths )->multitoken(), "List of depths to sweep through in bandwidth tests, running the test once per depth with the same clients (overrides -w)." )
     ( "perIterationDispatch,p", "Force a network dispatch every test iteration instead of the default single dispatch call at the end." )
-    ( "includeConnect,c", "Include connect time in reported bandwidths and latencies" );
+    ( "includeConnect,c", "Include connect time in reported bandwidths and latencies" )
+    ( "machineOutput,m", "Output results of each bandwidth test as a single line: depth, iteration frequency (Hz) and bandwidth (KB/s), separated by spaces." )
+    ( "readStdin,r", "Read command lines (i.e. the options listed here) from stdin, running each in turn with the same clients and printing '__DONE__<exit code>' after each." );
     po::variables_map argMap;
     po::store ( po::parse_command_line ( argc, argv, argDescriptions ), argMap );
     po::notify ( argMap );
@@ -152,14 +170,48 @@ int uhal::tests::PerfTester::run ( int argc, char* argv[] )
       m_includeConnect = true;
     }
 
+    if ( argMap.count ( "machineOutput" ) )
+    {
+      m_machineOutput = true;
+    }
+
+    if ( argMap.count ( "readStdin" ) )
+    {
+      if ( m_readingStdin )
+      {
+        cerr << "The -r option cannot be used in command lines read from stdin!" << endl;
+        return 40;
+      }
+
+      return runFromStdin ( argv[0] );
+    }
+
     if ( badInput() )
     {
       return 40;    // Report bad user input and exit if necessary.
     }
 
-    outputUserChoices();  // Echo back to the user the settings they have selected.
+    if ( ! m_machineOutput )
+    {
+      outputUserChoices();  // Echo back to the user the settings they have selected.
+    }
+
     buildClients(); // Build the clients from the device URIs provided by the user
-    ( this->*m_testFuncMap.find ( m_testName )->second ) (); // Calls the test function, based on the test name.
+    PtrToTestFunc lTestFunc = m_testFuncMap.find ( m_testName )->second;
+
+    if ( m_sweepDepths.empty() )
+    {
+      ( this->*lTestFunc ) (); // Calls the test function, based on the test name.
+    }
+    else
+    {
+      // Run the test once per depth, so that process startup and connection setup are only paid once for the whole sweep
+      for ( std::vector<boost::uint32_t>::const_iterator lIt = m_sweepDepths.begin(); lIt != m_sweepDepths.end(); lIt++ )
+      {
+        m_bandwidthTestDepth = *lIt;
+        ( this->*lTestFunc ) ();
+      }
+    }
   }
   catch ( std::exception& e )
   {
@@ -187,7 +239,9 @@ void uhal::tests::PerfTester::outputHelpText ( const string& argDescriptions ) c
        <<  argDescriptions
        <<  "Usage examples:\n\n"
        "  PerfTester.exe -t BandwidthTx -b 0xf0 -d ipbusudp-1.3://localhost:50001 ipbusudp-1.3://localhost:50002\n"
-       "  PerfTester.exe -t BandwidthTx -w 5 -i 100 chtcp-1.3://localhost:10203?target=127.0.0.1:50001" << endl;
+       "  PerfTester.exe -t BandwidthTx -w 5 -i 100 chtcp-1.3://localhost:10203?target=127.0.0.1:50001\n"
+       "  PerfTester.exe -t BandwidthRx -s 1 10 100 1000 -i 100 -d chtcp-1.3://localhost:10203?target=127.0.0.1:50001\n"
+       "  echo '-t BandwidthRx -w 1 -d chtcp-1.3://localhost:10203?target=127.0.0.1:50001' | PerfTester.exe -r" << endl;
   outputTestDescriptionsList();
 }
 
@@ -223,6 +277,24 @@ bool uhal::tests::PerfTester::badInput() const
     return true;
   }
 
+  if ( ( ! m_sweepDepths.empty() ) && ( m_testName.find ( "Bandwidth" ) != 0 ) )
+  {
+    cerr << "Depth sweeps (-s option) can only be used with the bandwidth tests!" << endl;
+    return true;
+  }
+
+  if ( m_includeConnect && ( ! m_sweepDepths.empty() ) )
+  {
+    cerr << "The include connect option (-c) cannot be used with depth sweeps (-s option), since the clients are only connected once!" << endl;
+    return true;
+  }
+
+  if ( m_includeConnect && m_readingStdin )
+  {
+    cerr << "The include connect option (-c) cannot be used when reading commands from stdin (-r option), since the clients are cached between commands!" << endl;
+    return true;
+  }
+
   return false;
 }
 
@@ -246,6 +318,33 @@ void uhal::tests::PerfTester::outputUserChoices() const
 }
 
 
+int uhal::tests::PerfTester::runFromStdin ( const std::string& aExecutable )
+{
+  m_readingStdin = true;
+  string lLine;
+
+  while ( getline ( cin, lLine ) )
+  {
+    // Split the line into whitespace-separated arguments (no quoting), and run it as if it were passed on the command line
+    istringstream lLineStream ( lLine );
+    StringVec lArgs ( 1, aExecutable );
+    copy ( istream_iterator<string> ( lLineStream ), istream_iterator<string>(), back_inserter ( lArgs ) );
+    std::vector<char*> lArgv;
+
+    for ( StringVec::iterator lIt = lArgs.begin(); lIt != lArgs.end(); lIt++ )
+    {
+      lArgv.push_back ( const_cast<char*> ( lIt->c_str() ) );
+    }
+
+    int lExitCode = run ( lArgv.size(), &lArgv[0] );
+    cout << "__DONE__" << lExitCode << endl;
+  }
+
+  m_readingStdin = false;
+  return 0;
+}
+
+
 void uhal::tests::PerfTester::buildClients()
 {
   if ( m_verbose )
@@ -258,11 +357,39 @@ void uhal::tests::PerfTester::buildClients()
     setLogLevelTo ( Warning() );
   }
 
+  m_clients.clear();
   m_clients.reserve ( m_deviceURIs.size() );
+  // Number of clients taken from cache so far for each URI (a URI may be listed several times, each needing its own client)
+  std::map<std::string, size_t> lNrCachedClientsUsed;
 
   for ( unsigned int iURI = 0 ; iURI < m_deviceURIs.size() ; ++iURI )
   {
-    m_clients.push_back ( ClientFactory::getInstance().getClient ( "MyDevice", m_deviceURIs.at ( iURI ) ) );
+    const std::string& lURI = m_deviceURIs.at ( iURI );
+    ClientVec& lCachedClients = m_clientCache[lURI];
+    size_t& lNrUsed = lNrCachedClientsUsed[lURI];
+
+    if ( lNrUsed == lCachedClients.size() )
+    {
+      lCachedClients.push_back ( ClientFactory::getInstance().getClient ( "MyDevice", lURI ) );
+    }
+
+    m_clients.push_back ( lCachedClients.at ( lNrUsed++ ) );
+  }
+
+  // Drop cached clients that aren't used by this command line, so that only the current test's connections stay open
+  for ( std::map<std::string, ClientVec>::iterator lIt = m_clientCache.begin() ; lIt != m_clientCache.end() ; )
+  {
+    const size_t lNrUsed = lNrCachedClientsUsed[lIt->first];
+
+    if ( lNrUsed == 0 )
+    {
+      m_clientCache.erase ( lIt++ );
+    }
+    else
+    {
+      lIt->second.resize ( lNrUsed );
+      ++lIt;
+    }
   }
 
   if ( m_verbose )
@@ -285,6 +412,15 @@ void uhal::tests::PerfTester::outputStandardResults ( double totalSeconds ) cons
 }
 
 
+void uhal::tests::PerfTester::outputMachineResults ( double totalSeconds, double dataRateKB_s ) const
+{
+  // Format in a local stream, so that the fixed/precision flags don't leak into later output on cout
+  ostringstream lStream;
+  lStream << m_bandwidthTestDepth << " " << fixed << setprecision ( 6 ) << m_iterations/totalSeconds << " " << dataRateKB_s;
+  cout << lStream.str() << endl;
+}
+
+
 bool uhal::tests::PerfTester::buffersEqual ( const U32Vec& writeBuffer, const U32ValVec& readBuffer ) const
 {
   return std::equal ( readBuffer.begin(), readBuffer.end(), writeBuffer.begin() );
@@ -313,6 +449,13 @@ void uhal::tests::PerfTester::bandwidthRxTest()
   double totalSeconds = measureReadLatency(lClients, m_baseAddr, m_bandwidthTestDepth, m_iterations, m_perIterationDispatch, m_verbose);
   double totalPayloadKB = m_deviceURIs.size() * m_iterations * m_bandwidthTestDepth * 4. / 1024.;
   double dataRateKB_s = totalPayloadKB/totalSeconds;
+
+  if ( m_machineOutput )
+  {
+    outputMachineResults ( totalSeconds, dataRateKB_s );
+    return;
+  }
+
   outputStandardResults ( totalSeconds );
   cout << "Read depth used each iteration  = " << m_bandwidthTestDepth << " 32-bit words\n"
        << "Total IPbus payload received    = " << totalPayloadKB << " KB\n"
@@ -340,6 +483,13 @@ void uhal::tests::PerfTester::bandwidthTxTest()
   double totalSeconds = measureWriteLatency(lClients, m_baseAddr, m_bandwidthTestDepth, m_iterations, m_perIterationDispatch, m_verbose);
   double totalPayloadKB = m_deviceURIs.size() * m_iterations * m_bandwidthTestDepth * 4. / 1024.;
   double dataRateKB_s = totalPayloadKB/totalSeconds;
+
+  if ( m_machineOutput )
+  {
+    outputMachineResults ( totalSeconds, dataRateKB_s );
+    return;
+  }
+
   outputStandardResults ( totalSeconds );
   cout << "Write depth used each iteration = " << m_bandwidthTestDepth << " 32-bit words\n"
        << "Total IPbus payload sent        = " << totalPayloadKB << " KB\n"
@@ -347,6 +497,13 @@ void uhal::tests::PerfTester::bandwidthTxTest()
 }
 
 
+void uhal::tests::PerfTester::bandwidthTxRxTest()
+{
+  bandwidthTxTest();
+  bandwidthRxTest();
+}
+
+
 void uhal::tests::PerfTester::validationTest()
 {
   std::vector<ClientInterface*> lClients;